@@ -0,0 +1,43 @@
+import numpy as np
+from numba import njit
+
+
+@njit(fastmath=True, cache=True)
+def triple_ema(x, a20, a50, a200):
+    """
+    Calculates three EMAs over the same price array in a single pass.
+
+    Each EMA follows the standard recurrence s_t = alpha * x_t + (1 - alpha) * s_{t-1},
+    seeded with s_0 = x_0, matching pandas' ewm(span=N, adjust=False).mean().
+
+    Args:
+        x (np.ndarray): 1-D array of closing prices.
+        a20 (float): Smoothing factor for the 20-period EMA (2 / (20 + 1)).
+        a50 (float): Smoothing factor for the 50-period EMA (2 / (50 + 1)).
+        a200 (float): Smoothing factor for the 200-period EMA (2 / (200 + 1)).
+
+    Returns:
+        tuple: (ema_20, ema_50, ema_200) as 1-D arrays the same length and dtype as `x`.
+    """
+    n = x.shape[0]
+    e20 = np.empty(n, dtype=x.dtype)
+    e50 = np.empty(n, dtype=x.dtype)
+    e200 = np.empty(n, dtype=x.dtype)
+    if n == 0:
+        return e20, e50, e200
+
+    s20 = s50 = s200 = x[0]
+    for i in range(n):
+        xi = x[i]
+        s20 = a20 * xi + (1 - a20) * s20
+        s50 = a50 * xi + (1 - a50) * s50
+        s200 = a200 * xi + (1 - a200) * s200
+        e20[i] = s20
+        e50[i] = s50
+        e200[i] = s200
+    return e20, e50, e200
+
+
+def alpha(span):
+    """Returns the EMA smoothing factor for a given span, as used by pandas' ewm(span=...)."""
+    return 2.0 / (span + 1)
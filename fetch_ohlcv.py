@@ -1,39 +1,138 @@
+import asyncio
 import ccxt
+import ccxt.async_support as ccxt_async
+import numpy as np
 import pandas as pd
 import datetime
 import os
+import uuid
 import json
-from google.oauth2 import service_account
-import pandas_gbq
+import concurrent.futures
+import google.auth
+from google.auth.exceptions import DefaultCredentialsError
+from google.cloud import bigquery
+from google.cloud import bigquery_storage_v1
+from google.cloud.bigquery_storage_v1 import types as storage_types
+from google.cloud.bigquery_storage_v1 import writer as storage_writer
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+
+from ema import alpha, triple_ema
 
 # --- BigQuery Configuration ---
-# IMPORTANT: Save your service account JSON content into a file named 'ema-analyzer-key.json'
-# in the same directory as your Python script, or provide the full path to it.
-SERVICE_ACCOUNT_FILE = 'ema-analyzer-key.json'
+# IMPORTANT: Credentials are read from Application Default Credentials. Point the GOOGLE_APPLICATION_CREDENTIALS
+# environment variable at your service account JSON key before running, e.g.:
+#     export GOOGLE_APPLICATION_CREDENTIALS=/path/to/ema-analyzer-key.json
+# They are loaded once per process, here, and main.py imports them from this module.
+BIGQUERY_SCOPES = ['https://www.googleapis.com/auth/bigquery']
 BIGQUERY_DATASET_ID = "emas_signals" # Your BigQuery dataset
+RAW_OHLCV_TABLE = "raw_ohlcv_emas" # Table holding the OHLCV data and EMAs
 
 # Initialize BigQuery related variables to None
 bq_credentials = None
 bq_project_id = None
 
 # Attempt to load BigQuery credentials
-if not os.path.exists(SERVICE_ACCOUNT_FILE):
-    print(f"Error: Service account key file '{SERVICE_ACCOUNT_FILE}' not found.")
-    print("Please save your service account JSON content into this file.")
-    print("You can download it from Google Cloud Console > IAM & Admin > Service Accounts > Your Service Account > Keys > Add Key > Create new key (JSON).")
-    # We will not exit here, but set credentials to None so BigQuery upload is skipped
-else:
-    try:
-        bq_credentials = service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE)
-        bq_project_id = bq_credentials.project_id
+try:
+    bq_credentials, bq_project_id = google.auth.default(scopes=BIGQUERY_SCOPES)
+    if bq_project_id:
         print(f"Authenticated successfully for Google Cloud Project: {bq_project_id}")
         print(f"Data will be saved to BigQuery Dataset: {BIGQUERY_DATASET_ID}")
+    else:
+        print("Error: Could not determine the Google Cloud Project from the default credentials.")
+        print("Please set GOOGLE_CLOUD_PROJECT, or use a service account key, which includes its project.")
+        # We will not exit here, but leave the project ID unset so BigQuery upload is skipped
 
-    except Exception as e:
-        print(f"Failed to load service account credentials for BigQuery: {e}")
-        print("Please ensure your service account JSON file is valid and accessible, and has sufficient BigQuery permissions.")
-        bq_credentials = None
-        bq_project_id = None
+except DefaultCredentialsError as e:
+    print(f"Failed to load default credentials for BigQuery: {e}")
+    print("Please set GOOGLE_APPLICATION_CREDENTIALS to the path of your service account JSON key file.")
+    print("You can download it from Google Cloud Console > IAM & Admin > Service Accounts > Your Service Account > Keys > Add Key > Create new key (JSON).")
+    bq_credentials = None
+    bq_project_id = None
+
+# --- Exchange Instances ---
+# One synchronous exchange per exchange ID, created and with markets loaded on first use.
+# Loading markets downloads the exchange's full market list, so it is done once per process.
+EXCHANGES = {}
+
+def get_exchange(exchange_id):
+    """Returns the shared exchange instance for `exchange_id`, creating it and loading its markets on first use."""
+    exchange = EXCHANGES.get(exchange_id)
+    if exchange is None:
+        exchange = getattr(ccxt, exchange_id)({'enableRateLimit': True})
+        exchange.load_markets()
+        EXCHANGES[exchange_id] = exchange
+    return exchange
+
+# --- OHLCV Pagination ---
+OHLCV_PAGE_LIMIT = 1000 # Candles requested per fetch_ohlcv call, unless the exchange allows fewer
+MAX_CONCURRENT_REQUESTS = 8 # Upper bound on in-flight fetch_ohlcv calls, to stay within exchange rate limits
+
+def ohlcv_page_limit(exchange, symbol):
+    """
+    Returns the number of candles to request per fetch_ohlcv call for `symbol`.
+
+    This is OHLCV_PAGE_LIMIT, capped at the maximum the exchange reports for the market type
+    (e.g., 720 on Kraken, 300 on Coinbase), so that concurrently requested pages join up.
+    """
+    market = exchange.market(symbol)
+    features = (getattr(exchange, 'features', None) or {}).get(market['type']) or {}
+    if market['type'] in ('swap', 'future'):
+        features = features.get('linear' if market.get('linear') else 'inverse') or {}
+    max_limit = (features.get('fetchOHLCV') or {}).get('limit')
+    return min(OHLCV_PAGE_LIMIT, max_limit) if max_limit else OHLCV_PAGE_LIMIT
+
+# --- OHLCV Cache ---
+# Raw candles are kept on disk, next to this script, between runs so that only the candles missing
+# from the cache need to be downloaded. Delete the cache file to force a full re-download.
+OHLCV_CACHE_FILE = '{exchange_id}_{symbol}_{timeframe}_ohlcv.parquet'
+OHLCV_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+# DataFrame attribute, stored in the Parquet metadata, recording the earliest timestamp (ms) the cache was fetched from.
+# A pair listed after that timestamp has no candles before its first cached one, so they are not requested again.
+OHLCV_CACHE_SINCE_ATTR = 'fetched_since_ms'
+
+def ohlcv_cache_path(exchange_id, symbol, timeframe):
+    """Returns the Parquet cache file path for one exchange/symbol/timeframe combination."""
+    file_name = OHLCV_CACHE_FILE.format(exchange_id=exchange_id, symbol=symbol.replace('/', ''), timeframe=timeframe).lower()
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), file_name)
+
+async def fetch_ohlcv_pages(exchange_id, markets, symbol, timeframe, since_list, until_list, page_limit):
+    """
+    Fetches one OHLCV page per start timestamp concurrently and returns the pages in request order.
+
+    A page that stops short of its end (the exchange returned fewer candles than requested)
+    is extended with further sequential requests, so no candles are skipped between pages.
+
+    Args:
+        exchange_id (str): The ID of the cryptocurrency exchange (e.g., 'binance', 'kraken').
+        markets (dict): Markets already loaded by a synchronous exchange instance, reused to skip a second load.
+        symbol (str): The trading pair (e.g., 'BTC/USDT', 'BTC/USD').
+        timeframe (str): The OHLCV timeframe (e.g., '1d' for daily, '1h' for hourly).
+        since_list (list): Start timestamp (ms) of each page.
+        until_list (list): End timestamp (ms) of each page, normally the next page's start.
+        page_limit (int): Candles requested per fetch_ohlcv call.
+
+    Returns:
+        list: One list per page of OHLCV rows as [timestamp, open, high, low, close, volume] lists.
+    """
+    exchange = getattr(ccxt_async, exchange_id)({'enableRateLimit': True})
+    exchange.set_markets(markets)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    timeframe_ms = exchange.parse_timeframe(timeframe) * 1000
+
+    async def fetch_page(since, until):
+        async with semaphore:
+            page = await exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=page_limit)
+            while page and page[-1][0] + timeframe_ms < until:
+                more = await exchange.fetch_ohlcv(symbol, timeframe, since=page[-1][0] + 1, limit=page_limit)
+                if not more or more[-1][0] <= page[-1][0]:
+                    break # No newer candles (e.g., the pair was delisted)
+                page += more
+            return page
+
+    try:
+        return await asyncio.gather(*(fetch_page(since, until) for since, until in zip(since_list, until_list)))
+    finally:
+        await exchange.close()
 
 def fetch_btc_ohlcv_with_emas(exchange_id='binance', symbol='BTC/USDT', timeframe='1d', since_days=365*3):
     """
@@ -50,63 +149,114 @@ def fetch_btc_ohlcv_with_emas(exchange_id='binance', symbol='BTC/USDT', timefram
                       Returns an empty DataFrame if data fetching fails.
     """
     try:
-        # Initialize the exchange
-        exchange = getattr(ccxt, exchange_id)()
-        exchange.load_markets()
+        # Get the exchange (initialized on first use)
+        exchange = get_exchange(exchange_id)
 
         # Calculate milliseconds for 'since' parameter
         # Fetching data up to today
-        end_timestamp_ms = exchange.parse8601(datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%fZ'))
+        end_timestamp_ms = exchange.milliseconds()
         start_timestamp_ms = end_timestamp_ms - (since_days * 24 * 60 * 60 * 1000)
 
-        # Ensure start_timestamp_ms is not too far in the past for exchanges with data limits
-        # (e.g., some exchanges might only provide a few years of daily data)
-        # It's good practice to fetch in chunks if you need a very long history.
-        # For simplicity, we'll try to fetch all at once, `ccxt` handles pagination internally for `fetch_ohlcv` up to its limits.
+        timeframe_ms = exchange.parse_timeframe(timeframe) * 1000
+
+        # Reuse previously downloaded candles and only fetch the ranges the cache does not cover.
+        # The cache is best-effort: if it cannot be read, all candles are fetched again.
+        cache_file = ohlcv_cache_path(exchange_id, symbol, timeframe)
+        cached_df = None
+        if os.path.exists(cache_file):
+            try:
+                cached_df = pd.read_parquet(cache_file, engine='pyarrow')
+            except (OSError, ValueError) as e:
+                print(f"Warning: could not read the OHLCV cache '{cache_file}', fetching all candles: {e}")
+            else:
+                if cached_df.empty or list(cached_df.columns) != OHLCV_COLUMNS:
+                    cached_df = None
+                else:
+                    cached_df = cached_df.astype(np.float64) # Older cache files were saved as float32
+                    print(f"Loaded {len(cached_df)} cached candles from '{cache_file}'.")
+
+        # Time ranges (ms) to fetch. With a cache, that is from the last cached candle onwards (fetched again since
+        # it may have been incomplete when it was saved), plus the head of the window if the cache was fetched from
+        # a later start. Caches saved without the fetched-since attribute are assumed to start at their first candle.
+        fetch_ranges = [(start_timestamp_ms, end_timestamp_ms)]
+        cache_since_ms = start_timestamp_ms
+        if cached_df is not None:
+            cached_start_ms = int(cached_df.index.min().timestamp() * 1000)
+            cached_end_ms = int(cached_df.index.max().timestamp() * 1000)
+            cached_since_ms = int(cached_df.attrs.get(OHLCV_CACHE_SINCE_ATTR, cached_start_ms))
+            fetch_ranges = [(max(start_timestamp_ms, cached_end_ms), end_timestamp_ms)]
+            if cached_since_ms > start_timestamp_ms:
+                fetch_ranges.insert(0, (start_timestamp_ms, cached_start_ms))
+            cache_since_ms = min(cached_since_ms, start_timestamp_ms)
 
         print(f"Fetching {symbol} {timeframe} data from {exchange_id}...")
-        print(f"Approx. start date: {datetime.datetime.fromtimestamp(start_timestamp_ms / 1000).strftime('%Y-%m-%d')}")
-
-        all_ohlcv = []
-        current_since = start_timestamp_ms # Start fetching from this timestamp
-
-        while True:
-            # Some exchanges require `since` to be the start of the desired period.
-            # Others take `since` as the point to continue from.
-            # ccxt's fetch_ohlcv generally handles pagination.
-            ohlcv_chunk = exchange.fetch_ohlcv(symbol, timeframe, since=current_since, limit=1000)
-            if not ohlcv_chunk:
-                break
-            all_ohlcv.extend(ohlcv_chunk)
-            
-            # Update current_since to the timestamp of the last fetched candle + 1ms
-            # to get the next chunk.
-            current_since = ohlcv_chunk[-1][0] + 1
-
-            # Stop if we've fetched data up to the recent past or no more data is returned
-            if current_since > end_timestamp_ms or len(ohlcv_chunk) < 1000:
-                break
-        
-        if not all_ohlcv:
+        for range_start_ms, range_end_ms in fetch_ranges:
+            print(f"Approx. date range: {datetime.datetime.fromtimestamp(range_start_ms / 1000).strftime('%Y-%m-%d')}"
+                  f" to {datetime.datetime.fromtimestamp(range_end_ms / 1000).strftime('%Y-%m-%d')}")
+
+        # Each page covers page_limit candles, so the page start times are known up front
+        # and all pages can be requested at once instead of one round-trip after another.
+        # Each page ends where the next page of its range starts, or at the end of its range.
+        page_limit = ohlcv_page_limit(exchange, symbol)
+        since_list, until_list = [], []
+        for range_start_ms, range_end_ms in fetch_ranges:
+            range_since = list(range(range_start_ms, range_end_ms, page_limit * timeframe_ms))
+            since_list += range_since
+            until_list += range_since[1:] + [range_end_ms]
+        pages = asyncio.run(fetch_ohlcv_pages(exchange_id, exchange.markets, symbol, timeframe,
+                                              since_list, until_list, page_limit))
+
+        row_count = sum(len(page) for page in pages)
+        if row_count == 0 and cached_df is None:
             print("No data fetched.")
             return pd.DataFrame()
 
+        # Copy each page straight into one preallocated float64 array (timestamps in ms are exact in float64),
+        # so the DataFrame wraps a ready numeric buffer instead of inferring types from nested lists
+        ohlcv = np.empty((row_count, 6), dtype=np.float64)
+        row = 0
+        for page in pages:
+            if page:
+                ohlcv[row:row + len(page)] = page
+                row += len(page)
+
         # Create a Pandas DataFrame
-        df = pd.DataFrame(all_ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+        df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'], copy=False)
+
+        # Pages requested before the pair's listing date all start at the first listed candle, so they overlap
+        df.drop_duplicates(subset='timestamp', inplace=True)
 
         # Convert timestamp to datetime and set as index
         df['datetime'] = pd.to_datetime(df['timestamp'], unit='ms')
         df.set_index('datetime', inplace=True)
         df.drop('timestamp', axis=1, inplace=True) # Remove original timestamp column
 
+        # Merge the new candles over the cached ones (newer values win) and refresh the cache
+        if cached_df is not None and df.empty:
+            df = cached_df
+        elif cached_df is not None:
+            df = pd.concat([cached_df, df])
+            df = df[~df.index.duplicated(keep='last')]
+
         # Sort by date to ensure correct EMA calculation
         df.sort_index(ascending=True, inplace=True)
 
+        # The candles stay float64 throughout, so the cache and the BigQuery tables keep exact prices
+        df.attrs[OHLCV_CACHE_SINCE_ATTR] = cache_since_ms
+        try:
+            df.to_parquet(cache_file, engine='pyarrow', compression='zstd')
+        except (OSError, ValueError) as e:
+            print(f"Warning: could not write the OHLCV cache '{cache_file}': {e}")
+
+        # Keep only the requested history window
+        df = df[df.index >= pd.to_datetime(start_timestamp_ms, unit='ms')]
+
         # Calculate EMAs
-        # adjust=False parameter ensures standard EMA calculation
-        df['EMA_20'] = df['close'].ewm(span=20, adjust=False).mean()
-        df['EMA_50'] = df['close'].ewm(span=50, adjust=False).mean()
-        df['EMA_200'] = df['close'].ewm(span=200, adjust=False).mean()
+        # One fused pass over the close buffer, same recurrence as ewm(span, adjust=False).
+        # The EMAs stay plain arrays until they are added to the DataFrame in a single assign.
+        close = df['close'].to_numpy()
+        ema_20, ema_50, ema_200 = triple_ema(close, alpha(20), alpha(50), alpha(200))
+        df = df.assign(EMA_20=ema_20, EMA_50=ema_50, EMA_200=ema_200)
 
         # Drop rows with NaN values resulting from EMA calculation (first 199 rows for EMA_200)
         df.dropna(inplace=True)
@@ -124,6 +274,162 @@ def fetch_btc_ohlcv_with_emas(exchange_id='binance', symbol='BTC/USDT', timefram
         print(f"An unexpected error occurred: {e}")
         return pd.DataFrame()
 
+# --- BigQuery Storage Write API ---
+APPEND_ROWS_BATCH_SIZE = 10000 # Rows per AppendRows request (~1 MB for OHLCV rows, well under the 10 MB limit)
+MAX_WRITE_STREAMS = 4 # Upper bound on pending write streams appended to in parallel
+
+def ohlcv_row_descriptor(columns):
+    """
+    Builds the protobuf descriptor of one OHLCV row for the Storage Write API.
+
+    'date' is encoded as int32 days since the Unix epoch (BigQuery DATE), every other column as double (BigQuery FLOAT).
+
+    Args:
+        columns (list): Column names, matching the BigQuery table's column names.
+
+    Returns:
+        descriptor_pb2.DescriptorProto: A self-contained descriptor for the row message.
+    """
+    descriptor = descriptor_pb2.DescriptorProto(name='OhlcvRow')
+    for number, column in enumerate(columns, start=1):
+        descriptor.field.add(
+            name=column,
+            number=number,
+            type=descriptor_pb2.FieldDescriptorProto.TYPE_INT32 if column == 'date' else descriptor_pb2.FieldDescriptorProto.TYPE_DOUBLE,
+            label=descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL
+        )
+    return descriptor
+
+def append_to_pending_stream(write_client, parent, proto_schema, serialized_rows):
+    """
+    Appends serialized rows to a new PENDING write stream and finalizes it.
+
+    Rows in a pending stream stay invisible until the stream is committed with batch_commit_write_streams.
+
+    Args:
+        write_client (bigquery_storage_v1.BigQueryWriteClient): The Storage Write API client.
+        parent (str): The destination table path ('projects/.../datasets/.../tables/...').
+        proto_schema (storage_types.ProtoSchema): Schema of the serialized rows.
+        serialized_rows (list): Rows as serialized protobuf messages (bytes).
+
+    Returns:
+        str: The name of the finalized write stream.
+    """
+    write_stream = write_client.create_write_stream(
+        parent=parent,
+        write_stream=storage_types.WriteStream(type_=storage_types.WriteStream.Type.PENDING)
+    )
+    request_template = storage_types.AppendRowsRequest(
+        write_stream=write_stream.name,
+        proto_rows=storage_types.AppendRowsRequest.ProtoData(writer_schema=proto_schema)
+    )
+    append_rows_stream = storage_writer.AppendRowsStream(write_client, request_template)
+    try:
+        # Send every batch before waiting, so the requests are pipelined on the stream
+        responses = []
+        for offset in range(0, len(serialized_rows), APPEND_ROWS_BATCH_SIZE):
+            request = storage_types.AppendRowsRequest(
+                offset=offset,
+                proto_rows=storage_types.AppendRowsRequest.ProtoData(
+                    rows=storage_types.ProtoRows(serialized_rows=serialized_rows[offset:offset + APPEND_ROWS_BATCH_SIZE])
+                )
+            )
+            responses.append(append_rows_stream.send(request))
+        for response in responses:
+            response.result()
+    finally:
+        append_rows_stream.close()
+
+    write_client.finalize_write_stream(name=write_stream.name)
+    return write_stream.name
+
+def write_to_staging_table(btc_data_df, credentials, project_id, dataset_id, table_name, value_columns):
+    """
+    Writes the OHLCV and EMA data to an empty table through pending streams, and commits them together.
+
+    Args:
+        btc_data_df (pd.DataFrame): OHLCV data and EMAs, indexed by candle datetime.
+        credentials (google.auth.credentials.Credentials): Credentials used for the Storage Write API client.
+        project_id (str): The Google Cloud project that owns the dataset.
+        dataset_id (str): The BigQuery dataset holding the table.
+        table_name (str): The BigQuery table to write to.
+        value_columns (list): The DataFrame columns to write, after the 'date' column.
+    """
+    # Serialize every row as a protobuf message
+    descriptor = ohlcv_row_descriptor(['date'] + value_columns)
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(descriptor_pb2.FileDescriptorProto(name='ohlcv_row.proto', syntax='proto2', message_type=[descriptor]))
+    row_message = message_factory.GetMessageClass(pool.FindMessageTypeByName(descriptor.name))
+
+    days_since_epoch = btc_data_df.index.values.astype('datetime64[D]').astype(np.int64).tolist()
+    values = [btc_data_df[col].to_numpy(dtype=np.float64).tolist() for col in value_columns]
+    serialized_rows = [
+        row_message(date=day, **dict(zip(value_columns, row_values))).SerializeToString()
+        for day, *row_values in zip(days_since_epoch, *values)
+    ]
+
+    # Split the rows into contiguous slices, one pending stream each
+    stream_count = max(1, min(MAX_WRITE_STREAMS, -(-len(serialized_rows) // APPEND_ROWS_BATCH_SIZE)))
+    bounds = np.linspace(0, len(serialized_rows), stream_count + 1).astype(int)
+    row_slices = [serialized_rows[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+    write_client = bigquery_storage_v1.BigQueryWriteClient(credentials=credentials)
+    parent = write_client.table_path(project_id, dataset_id, table_name)
+    proto_schema = storage_types.ProtoSchema(proto_descriptor=descriptor)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=stream_count) as executor:
+        stream_names = list(executor.map(
+            lambda rows: append_to_pending_stream(write_client, parent, proto_schema, rows), row_slices
+        ))
+
+    # Make all rows visible at once
+    commit_response = write_client.batch_commit_write_streams(
+        storage_types.BatchCommitWriteStreamsRequest(parent=parent, write_streams=stream_names)
+    )
+    if commit_response.stream_errors:
+        raise RuntimeError(f"Failed to commit write streams: {list(commit_response.stream_errors)}")
+
+def save_ohlcv_to_bigquery(btc_data_df, credentials, project_id, dataset_id=BIGQUERY_DATASET_ID, table_name=RAW_OHLCV_TABLE):
+    """
+    Replaces a BigQuery table with the OHLCV and EMA data returned by fetch_btc_ohlcv_with_emas.
+
+    Rows are written through the BigQuery Storage Write API into a fresh staging table: they are split across
+    up to MAX_WRITE_STREAMS pending streams appended to in parallel, and all streams are committed together.
+    The staging table is then copied over the destination table, which replaces its rows and schema atomically,
+    so the destination keeps its previous contents if any step fails.
+
+    Args:
+        btc_data_df (pd.DataFrame): OHLCV data and EMAs, indexed by candle datetime.
+        credentials (google.auth.credentials.Credentials): Credentials used for the BigQuery clients.
+        project_id (str): The Google Cloud project that owns the dataset.
+        dataset_id (str): The BigQuery dataset to write to.
+        table_name (str): The BigQuery table to write to.
+
+    Returns:
+        str: The fully qualified destination table.
+    """
+    destination_table = f"{project_id}.{dataset_id}.{table_name}"
+    print(f"Saving data to BigQuery table '{destination_table}'...")
+
+    # The Storage Write API only writes to existing tables, so create a staging table with this run's schema.
+    # Its name is unique per run, so it never collides with a concurrent run, and it is deleted once copied.
+    # The datetime index becomes the 'date' column (BigQuery DATE).
+    client = bigquery.Client(credentials=credentials, project=project_id)
+    value_columns = list(btc_data_df.columns)
+    table_schema = [bigquery.SchemaField('date', 'DATE')] + [bigquery.SchemaField(col, 'FLOAT') for col in value_columns]
+    staging_table_name = f"{table_name}_staging_{uuid.uuid4().hex}"
+    staging_table = bigquery.Table(f"{project_id}.{dataset_id}.{staging_table_name}", schema=table_schema)
+    staging_table = client.create_table(staging_table)
+    try:
+        write_to_staging_table(btc_data_df, credentials, project_id, dataset_id, staging_table_name, value_columns)
+
+        # Swap the staging table in: the copy job replaces the destination's rows and schema in one atomic operation
+        copy_config = bigquery.CopyJobConfig(write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
+        client.copy_table(staging_table, destination_table, job_config=copy_config).result()
+    finally:
+        client.delete_table(staging_table, not_found_ok=True)
+
+    return destination_table
+
 # --- Main execution block ---
 if __name__ == '__main__':
     # --- Configuration for data fetching ---
@@ -146,30 +452,8 @@ if __name__ == '__main__':
 
         # Only attempt BigQuery save if credentials and project_id were successfully loaded
         if bq_credentials and bq_project_id:
-            table_name = "raw_ohlcv_emas" # Name of the table in BigQuery
-
-            # Convert datetime index to a column for BigQuery upload
-            # BigQuery doesn't directly support pandas datetime index, prefer a regular column
-            df_to_upload = btc_data_df.reset_index()
-            df_to_upload.rename(columns={'datetime': 'date'}, inplace=True)
-
-            # Ensure 'date' column is in datetime format before converting to date
-            df_to_upload['date'] = pd.to_datetime(df_to_upload['date'])
-
-            # Convert datetime objects to date objects for BigQuery DATE type
-            # If you want TIMESTAMP, leave as datetime.
-            df_to_upload['date'] = df_to_upload['date'].dt.date
-
-            destination_table = f"{BIGQUERY_DATASET_ID}.{table_name}"
             try:
-                print(f"Saving data to BigQuery table '{destination_table}'...")
-                pandas_gbq.to_gbq(
-                    df_to_upload,
-                    destination_table,
-                    project_id=bq_project_id,
-                    if_exists='replace',  # Options: 'fail', 'replace', 'append'
-                    credentials=bq_credentials
-                )
+                save_ohlcv_to_bigquery(btc_data_df, bq_credentials, bq_project_id)
                 print(f"Successfully saved data to BigQuery.")
             except Exception as e:
                 print(f"Error saving data to BigQuery: {e}")
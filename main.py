@@ -1,149 +1,94 @@
-import yfinance as yf
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
+import polars as pl
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import json
-from google.oauth2 import service_account
-import pandas_gbq
-import os
+from google.cloud import bigquery
+import concurrent.futures
+
+from fetch_ohlcv import (
+    BIGQUERY_DATASET_ID,
+    RAW_OHLCV_TABLE,
+    bq_credentials,
+    bq_project_id,
+    fetch_btc_ohlcv_with_emas,
+    save_ohlcv_to_bigquery,
+)
 
 # --- Configuration ---
-ticker = "BTC-USD"
-# Fetch data for the last 10 years
-end_date = datetime.now()
-start_date = end_date - timedelta(days=10 * 365) # Using 365 days for a year for better accuracy
-
-print(f"Fetching {ticker} data from {start_date.date()} to {end_date.date()}")
+# OHLCV data and EMAs come from fetch_ohlcv, so this script and the raw_ohlcv_emas table share one download
+exchange_to_use = 'binance'  # e.g., 'binance', 'kraken', 'coinbasepro'
+trading_symbol = 'BTC/USDT'  # or 'BTC/USD' depending on the exchange
+data_timeframe = '1d'        # '1d' for daily, '1h' for hourly, etc.
+historical_days = 365 * 10    # Fetch 10 years of daily data
+# Binance only has BTC/USDT candles from its listing on 2017-08-17, so the history starts there if that is later
 
 # --- BigQuery Configuration ---
-# IMPORTANT: Save your service account JSON content into a file named 'ema-analyzer-key.json'
-# in the same directory as your Python script, or provide the full path to it.
-SERVICE_ACCOUNT_FILE = 'ema-analyzer-key.json'
-
-# Initialize BigQuery related variables to None or default values
-# This ensures they are defined even if the try block fails
-credentials = None
-project_id = None
-dataset_id = "emas_signals" # This can be safely initialized here as it's a fixed string
-
-if not os.path.exists(SERVICE_ACCOUNT_FILE):
-    print(f"Error: Service account key file '{SERVICE_ACCOUNT_FILE}' not found.")
-    print("Please save your service account JSON content into this file.")
-    print("You can download it from Google Cloud Console > IAM & Admin > Service Accounts > Your Service Account > Keys > Add Key > Create new key (JSON).")
-    exit() # Exit if the file itself is not found
-
-try:
-    credentials = service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE)
-    project_id = credentials.project_id  # Project ID can be extracted directly from credentials
-
-    # Optional: Verify dataset existence or create it (requires google-cloud-bigquery client)
-    # This part is commented out by default, uncomment if you need it.
-    # from google.cloud import bigquery
-    # client = bigquery.Client(credentials=credentials, project=project_id)
-    # try:
-    #     client.get_dataset(f"{project_id}.{dataset_id}")
-    #     print(f"BigQuery Dataset '{dataset_id}' exists.")
-    # except Exception:
-    #     print(f"BigQuery Dataset '{dataset_id}' does not exist. Attempting to create it...")
-    #     dataset = bigquery.Dataset(f"{project_id}.{dataset_id}")
-    #     dataset.location = "US"  # Set your desired location
-    #     client.create_dataset(dataset)
-    #     print(f"BigQuery Dataset '{dataset_id}' created.")
-
-    print(f"Authenticated successfully for Google Cloud Project: {project_id}")
-    print(f"Data will be saved to BigQuery Dataset: {dataset_id}")
-
-except Exception as e:
-    print(f"Failed to load service account credentials or connect to BigQuery: {e}")
-    print("Please ensure your service account JSON file is valid and accessible, and that it has sufficient BigQuery permissions.")
-    # We set credentials and project_id to None to signal failure for the later BigQuery upload
-    credentials = None
-    project_id = None
-    # We do NOT exit here directly anymore, so the rest of the script can still run
-    # (e.g., data fetching, EMA calculations, local display), but BigQuery saving will be skipped.
+# Credentials are loaded once when fetch_ohlcv is imported (see its 'BigQuery Configuration' section)
+credentials = bq_credentials
+project_id = bq_project_id
+dataset_id = BIGQUERY_DATASET_ID
+
+# Optional: Verify dataset existence or create it (requires google-cloud-bigquery client)
+# This part is commented out by default, uncomment if you need it.
+# from google.cloud import bigquery
+# client = bigquery.Client(credentials=credentials, project=project_id)
+# try:
+#     client.get_dataset(f"{project_id}.{dataset_id}")
+#     print(f"BigQuery Dataset '{dataset_id}' exists.")
+# except Exception:
+#     print(f"BigQuery Dataset '{dataset_id}' does not exist. Attempting to create it...")
+#     dataset = bigquery.Dataset(f"{project_id}.{dataset_id}")
+#     dataset.location = "US"  # Set your desired location
+#     client.create_dataset(dataset)
+#     print(f"BigQuery Dataset '{dataset_id}' created.")
 
 # --- Data Fetching and EMA Calculation ---
 try:
-    df = yf.download(ticker, start=start_date, end=end_date, progress=False, auto_adjust=True)
+    df = fetch_btc_ohlcv_with_emas(exchange_to_use, trading_symbol, data_timeframe, historical_days)
 
     if df.empty:
-        print("No data fetched. Check ticker or date range. Exiting.")
+        print("No data fetched. Check exchange, symbol or date range. Exiting.")
         exit()
 
-    df['Close'] = df['Close'].astype(float)
-
-    # Calculate EMAs
-    df['EMA_20'] = df['Close'].ewm(span=20, adjust=False).mean()
-    df['EMA_50'] = df['Close'].ewm(span=50, adjust=False).mean()
-    df['EMA_200'] = df['Close'].ewm(span=200, adjust=False).mean()
-
-    # Drop rows with NaN values resulting from EMA calculation (first 199 rows for EMA_200)
-    df.dropna(inplace=True)
+    # The analysis below runs on a Polars frame; results go back to pandas only for the BigQuery upload.
+    # The crossover pass only needs the sign of the EMA spreads, so it reads the EMAs as float32 (half the bytes);
+    # prices stay float64, so crossover_summary keeps exact prices.
+    ohlcv = pl.from_pandas(df.reset_index()).with_columns(pl.col('EMA_20', 'EMA_50', 'EMA_200').cast(pl.Float32))
 
     # --- Crossover Detection ---
 
-    # 20/50 EMA Crossover
-    df['20_50_diff'] = df['EMA_20'] - df['EMA_50']
-    df['20_50_bullish'] = (df['20_50_diff'].shift(1) < 0) & (df['20_50_diff'] > 0)
-    df['20_50_bearish'] = (df['20_50_diff'].shift(1) > 0) & (df['20_50_diff'] < 0)
-
-    # 50/200 EMA Crossover
-    df['50_200_diff'] = df['EMA_50'] - df['EMA_200']
-    df['50_200_golden'] = (df['50_200_diff'].shift(1) < 0) & (df['50_200_diff'] > 0)
-    df['50_200_death'] = (df['50_200_diff'].shift(1) > 0) & (df['50_200_diff'] < 0)
+    # A crossover is a sign flip of the EMA spread between consecutive days:
+    # a step of +2 (-1 -> +1) is a cross up, a step of -2 (+1 -> -1) is a cross down.
+    signals = ohlcv.select(
+        pl.col('datetime').dt.date().alias('date'),
+        pl.col('close').alias('price'),
+        # 20/50 EMA Crossover
+        (pl.col('EMA_20') - pl.col('EMA_50')).sign().cast(pl.Int8).diff().fill_null(0).alias('step_20_50'),
+        # 50/200 EMA Crossover
+        (pl.col('EMA_50') - pl.col('EMA_200')).sign().cast(pl.Int8).diff().fill_null(0).alias('step_50_200'),
+    )
 
     # --- Consolidate and Output Results ---
-    all_crossovers = []
-
-    # Collect 20/50 Bullish Crossovers
-    bullish_20_50_crosses_df = df[df['20_50_bullish']]
-    if not bullish_20_50_crosses_df.empty:
-        for date, row in bullish_20_50_crosses_df.iterrows():
-            all_crossovers.append({
-                'date': date.date(),
-                'type': 'BULLISH CROSS (20/50)',
-                'price': row['Close'].item()
-            })
-
-    # Collect 20/50 Bearish Crossovers
-    bearish_20_50_crosses_df = df[df['20_50_bearish']]
-    if not bearish_20_50_crosses_df.empty:
-        for date, row in bearish_20_50_crosses_df.iterrows():
-            all_crossovers.append({
-                'date': date.date(),
-                'type': 'BEARISH CROSS (20/50)',
-                'price': row['Close'].item()
-            })
-
-    # Collect 50/200 Golden Crosses
-    golden_crosses_df = df[df['50_200_golden']]
-    if not golden_crosses_df.empty:
-        for date, row in golden_crosses_df.iterrows():
-            all_crossovers.append({
-                'date': date.date(),
-                'type': 'GOLDEN CROSS (50/200)',
-                'price': row['Close'].item()
-            })
-
-    # Collect 50/200 Death Crosses
-    death_crosses_df = df[df['50_200_death']]
-    if not death_crosses_df.empty:
-        for date, row in death_crosses_df.iterrows():
-            all_crossovers.append({
-                'date': date.date(),
-                'type': 'DEATH CROSS (50/200)',
-                'price': row['Close'].item()
-            })
+    crossover_rules = {
+        'BULLISH CROSS (20/50)': pl.col('step_20_50') == 2,
+        'BEARISH CROSS (20/50)': pl.col('step_20_50') == -2,
+        'GOLDEN CROSS (50/200)': pl.col('step_50_200') == 2,
+        'DEATH CROSS (50/200)': pl.col('step_50_200') == -2,
+    }
 
     # Sort all collected crossovers by date (most recent to oldest)
-    all_crossovers.sort(key=lambda x: x['date'], reverse=True)
+    all_crossovers_df = pl.concat([
+        signals.filter(rule).select('date', pl.lit(crossover_type).alias('type'), 'price')
+        for crossover_type, rule in crossover_rules.items()
+    ]).sort('date', descending=True, maintain_order=True)
 
     print("\n--- All Recent Crossovers (Most Recent First) ---")
 
-    if all_crossovers:
-        for crossover in all_crossovers:
-            print(f"{crossover['date']} | {crossover['type']} | Price: ${crossover['price']:,.2f}")
+    if not all_crossovers_df.is_empty():
+        for date, crossover_type, price in all_crossovers_df.iter_rows():
+            print(f"{date} | {crossover_type} | Price: ${price:,.2f}")
     else:
         print("No crossovers found in the historical data.")
 
@@ -151,21 +96,11 @@ except Exception as e:
     print(f"An error occurred during data fetching or crossover detection: {e}")
     exit() # Exit if primary data fetching or EMA calculation fails
 
-# Convert the list of crossovers to a DataFrame
-crossover_df = pd.DataFrame(all_crossovers)
-
-# If crossover_df is empty after processing, there's nothing more to do
-if crossover_df.empty:
+# If there are no crossovers, there's nothing more to do
+if all_crossovers_df.is_empty():
     print("\nNo crossovers found to process for interval analysis. Exiting.")
     exit()
 
-# Rename columns to match your requested format
-crossover_df.rename(columns={
-    'date': 'Date',
-    'type': 'Category',
-    'price': 'Price'
-}, inplace=True)
-
 # --- Add Numerical Category Column ---
 # Define the mapping dictionary for categories to numbers
 category_to_num_map = {
@@ -174,85 +109,55 @@ category_to_num_map = {
     'GOLDEN CROSS (50/200)': 3,
     'DEATH CROSS (50/200)': 4
 }
-# Create the new 'Category_Num' column in crossover_df
-crossover_df['Category_Num'] = crossover_df['Category'].map(category_to_num_map)
-
-# Format price as integer for display (but keep as float internally for BigQuery upload)
-display_df = crossover_df[['Date', 'Category', 'Price']].copy()
-display_df['Price'] = display_df['Price'].apply(lambda x: f"${int(x):,}")
-
 
-
-# Ensure the 'Date' column is in datetime format
-crossover_df['Date'] = pd.to_datetime(crossover_df['Date'])
-
-# Create a list to store interval DataFrames
-interval_dfs = []
-
-# For each category, calculate the time between consecutive events
-for category in crossover_df['Category'].unique():
-    # Filter for this category and sort by date
-    category_df = crossover_df[crossover_df['Category'] == category].sort_values('Date')
-
-    # Skip categories with only one event
-    if len(category_df) <= 1:
-        continue  # Skip to the next category
-
-    # Calculate the days between consecutive events
-    category_df['Days Between'] = category_df['Date'].diff().dt.days
-
-    # Create a DataFrame for the intervals
-    intervals = pd.DataFrame({
-        'Category': category,
-        'Category_Num': category_df['Category_Num'],
-        'Previous Date': category_df['Date'].shift(1),
-        'Current Date': category_df['Date'],
-        'Days Between': category_df['Days Between']
-    }).dropna(subset=['Days Between'])  # Explicitly drop NaNs only from 'Days Between'
-
-    if not intervals.empty:
-        interval_dfs.append(intervals)
-
-# Initialize interval_df, summary_stats, and distribution_df as empty DataFrames
+# Rename columns to match your requested format and add the 'Category_Num' column
+crossover_df = all_crossovers_df.rename({
+    'date': 'Date',
+    'type': 'Category',
+    'price': 'Price'
+}).with_columns(
+    pl.col('Category').replace_strict(category_to_num_map, return_dtype=pl.Int64).alias('Category_Num')
+)
+
+# Calculate the days between consecutive events of each category in one windowed pass.
+# The first event of each category has no predecessor, so its null interval is dropped.
+interval_df = crossover_df.sort(['Category_Num', 'Date'], maintain_order=True).select(
+    'Category',
+    'Category_Num',
+    pl.col('Date').shift(1).over('Category').alias('Previous Date'),
+    pl.col('Date').alias('Current Date'),
+    pl.col('Date').diff().over('Category').dt.total_days().cast(pl.Float64).alias('Days Between'),
+).drop_nulls('Days Between')
+
+# Initialize summary_stats and distribution_df as empty DataFrames
 # in case no intervals are calculated. This prevents NameError later.
-interval_df = pd.DataFrame()
-summary_stats = pd.DataFrame()
-distribution_df = pd.DataFrame()
-
-# Combine all intervals if we have any
-if interval_dfs:
-    interval_df = pd.concat(interval_dfs, ignore_index=True)
+summary_stats = pl.DataFrame()
+distribution_df = pl.DataFrame()
 
+if not interval_df.is_empty():
     # Debugging: Print columns to ensure 'Days Between' and 'Category_Num' are present
-    print("\nColumns available in interval_df:", interval_df.columns.tolist())
+    print("\nColumns available in interval_df:", interval_df.columns)
 
     # Format dates for display
-    interval_df['Previous Date'] = interval_df['Previous Date'].dt.strftime('%Y-%m-%d')
-    interval_df['Current Date'] = interval_df['Current Date'].dt.strftime('%Y-%m-%d')
-
-    # Calculate summary statistics
-    summary_stats = interval_df.groupby('Category')['Days Between'].agg(
-        ['mean', 'median', 'min', 'max', 'std', 'count']
-    ).reset_index()
-
-    # Rename columns for clarity
-    summary_stats.columns = [
-        'Category',
-        'Avg Days Between',
-        'Median Days Between',
-        'Min Days Between',
-        'Max Days Between',
-        'Std Dev Days',
-        'Interval Count'
-    ]
-
-    # Format the statistics
-    summary_stats['Avg Days Between'] = summary_stats['Avg Days Between'].round(1)
-    summary_stats['Std Dev Days'] = summary_stats['Std Dev Days'].round(1)
+    interval_df = interval_df.with_columns(
+        pl.col('Previous Date').dt.to_string('%Y-%m-%d'),
+        pl.col('Current Date').dt.to_string('%Y-%m-%d'),
+    )
+
+    # Calculate summary statistics, with clear column names
+    summary_stats = interval_df.group_by('Category').agg(
+        pl.col('Days Between').mean().round(1).alias('Avg Days Between'),
+        pl.col('Days Between').median().alias('Median Days Between'),
+        pl.col('Days Between').min().alias('Min Days Between'),
+        pl.col('Days Between').max().alias('Max Days Between'),
+        pl.col('Days Between').std().round(1).alias('Std Dev Days'),
+        pl.len().cast(pl.Int64).alias('Interval Count'),
+    ).sort('Category')
 
     # Display the detailed intervals (including the new Category_Num)
     print("\nTime Between Consecutive Crossovers by Category:")
-    print(interval_df[['Category', 'Category_Num', 'Previous Date', 'Current Date', 'Days Between']].to_string())
+    with pl.Config(tbl_rows=-1):
+        print(interval_df)
 
 
 
@@ -261,38 +166,34 @@ if interval_dfs:
             float('inf')]
     labels = [f'{b}-{bins[i + 1] - 1}' for i, b in enumerate(bins[:-2])] + [f'{bins[-2]}+']
 
-    # Create an empty dictionary to store the distribution data for each category
-    distribution_data = {}
+    # Bucket each interval with a binary search over the left bin edges (bins are closed on the left),
+    # then count the bucket indices
+    bin_edges = np.asarray(bins[:-1])
 
-    for category in interval_df['Category'].unique():
-        category_intervals = interval_df[interval_df['Category'] == category]['Days Between'].dropna()
+    def histogram(values):
+        bucket = np.clip(np.searchsorted(bin_edges, values, side='right') - 1, 0, len(labels) - 1)
+        return np.bincount(bucket, minlength=len(labels))
 
-        if not category_intervals.empty:
-            # Calculate the histogram counts
-            counts, _ = pd.cut(category_intervals, bins=bins, labels=labels, right=False,
-                               include_lowest=True).value_counts(sort=False).align(pd.Series(0, index=labels),
-                                                                                  fill_value=0)
-            distribution_data[category] = counts
-        else:
-            distribution_data[category] = pd.Series(0, index=labels)
+    # One row per 'Days Between Range' bucket, one count column per category
+    distribution_data = {'Days Between Range': labels}
 
-    # Convert the dictionary of distributions to a DataFrame
-    distribution_df = pd.DataFrame(distribution_data)
+    for category in interval_df['Category'].unique(maintain_order=True):
+        category_intervals = interval_df.filter(pl.col('Category') == category)['Days Between'].drop_nulls().to_numpy()
+        distribution_data[category] = histogram(category_intervals)
 
-    # Rename the index to 'Days Between Range'
-    distribution_df.index.name = 'Days Between Range'
+    distribution_df = pl.DataFrame(distribution_data)
 
     # --- Sanitize column names for BigQuery ---
     # Create a mapping for invalid characters to underscores, then map problematic strings
     # to simpler, valid BigQuery column names.
     # Example: 'BULLISH CROSS (20/50)' -> 'BULLISH_CROSS_20_50'
     sanitized_columns = {}
-    for col in distribution_df.columns:
+    for col in distribution_df.columns[1:]:
         sanitized_name = col.replace(' ', '_').replace('(', '').replace(')', '').replace('/', '_').replace('-', '_')
         # Ensure no double underscores or leading/trailing underscores from replacements
         sanitized_name = '_'.join(filter(None, sanitized_name.split('_')))
         sanitized_columns[col] = sanitized_name.upper() # Convert to upper for consistency
-    distribution_df.rename(columns=sanitized_columns, inplace=True)
+    distribution_df = distribution_df.rename(sanitized_columns)
 
 
 
@@ -303,36 +204,53 @@ print("\n--- Saving DataFrames to Google BigQuery ---")
 
 # Only attempt BigQuery save if credentials and project_id were successfully loaded
 if credentials and project_id:
-    # Removed 'raw_ema_data' from the dictionary of DataFrames to save
+    # The analysis tables are written with load jobs below; raw_ohlcv_emas is written by save_ohlcv_to_bigquery
+    # The BigQuery client loads pandas DataFrames, so this is where the Polars results are converted
     dataframes_to_save = {
-        "crossover_summary": crossover_df.copy(),
-        "crossover_intervals": interval_df.copy(), # Now interval_df is always a DataFrame (empty if no intervals)
-        "crossover_interval_summary": summary_stats.copy(), # Now summary_stats is always a DataFrame
-        "crossover_interval_distribution": distribution_df.copy(), # Now distribution_df is always a DataFrame
+        "crossover_summary": crossover_df.to_pandas(),
+        "crossover_intervals": interval_df.to_pandas(), # Now interval_df is always a DataFrame (empty if no intervals)
+        "crossover_interval_summary": summary_stats.to_pandas(), # Now summary_stats is always a DataFrame
+        "crossover_interval_distribution": distribution_df.to_pandas(), # Now distribution_df is always a DataFrame
     }
 
+    def upload_one(table_name, dataframe):
+        # Each table is written with a batch LOAD job using Parquet serialization (requires pyarrow).
+        # Datetime columns are declared as BigQuery DATE in the schema and converted during
+        # serialization, so the DataFrames are uploaded as-is without copying them first.
+        job_config = bigquery.LoadJobConfig(
+            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,  # Replace the table contents
+            source_format=bigquery.SourceFormat.PARQUET,
+            schema=[
+                bigquery.SchemaField(col, 'DATE') for col in dataframe.columns
+                if pd.api.types.is_datetime64_any_dtype(dataframe[col])
+            ]
+        )
+
+        # Each worker thread gets its own client rather than sharing one across threads
+        client = bigquery.Client(credentials=credentials, project=project_id)
+        destination_table = f"{project_id}.{dataset_id}.{table_name}"
+        print(f"Saving '{table_name}' to BigQuery table '{destination_table}'...")
+        client.load_table_from_dataframe(dataframe, destination_table, job_config=job_config).result()
+
     for table_name, dataframe in dataframes_to_save.items():
-        if not dataframe.empty:
-            # Convert datetime objects to date objects for BigQuery DATE type
-            for col in dataframe.columns:
-                if pd.api.types.is_datetime64_any_dtype(dataframe[col]):
-                    dataframe[col] = dataframe[col].dt.date
+        if dataframe.empty:
+            print(f"DataFrame '{table_name}' is empty, skipping BigQuery upload.")
 
-            destination_table = f"{dataset_id}.{table_name}"
+    # The load jobs are independent, so submit them all and wait on them together
+    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+        futures = {
+            executor.submit(upload_one, table_name, dataframe): table_name
+            for table_name, dataframe in dataframes_to_save.items() if not dataframe.empty
+        }
+        # The OHLCV data and EMAs fetched above also go to raw_ohlcv_emas, so fetch_ohlcv.py need not run separately
+        futures[executor.submit(save_ohlcv_to_bigquery, df, credentials, project_id, dataset_id)] = RAW_OHLCV_TABLE
+        for future in concurrent.futures.as_completed(futures):
+            table_name = futures[future]
             try:
-                print(f"Saving '{table_name}' to BigQuery table '{destination_table}'...")
-                pandas_gbq.to_gbq(
-                    dataframe,
-                    destination_table,
-                    project_id=project_id,
-                    if_exists='replace',  # Options: 'fail', 'replace', 'append'
-                    credentials=credentials
-                )
+                future.result()
                 print(f"Successfully saved '{table_name}' to BigQuery.")
             except Exception as e:
                 print(f"Error saving '{table_name}' to BigQuery: {e}")
-        else:
-            print(f"DataFrame '{table_name}' is empty, skipping BigQuery upload.")
 else:
     print("\nSkipping BigQuery saving: Credentials or Project ID could not be loaded successfully earlier. Please check the initial BigQuery Configuration section for errors.")
 